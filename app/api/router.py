@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 
 from fastapi import (
@@ -8,19 +9,21 @@ from fastapi import (
     WebSocket,
     WebSocketDisconnect,
 )
-from fastapi.encoders import jsonable_encoder
 from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 from starlette import status
 
-from app.db.database import get_db
-from app.models.item_model import ItemModel
+from app.db.database import dialect_insert, get_db
+from app.models.item_model import ItemModel, item_to_dict
 from app.models.pydantic_item_dto import Item, ItemCreate, ItemUpdate
 from app.tasks.task_poller import Poller
 from app.ws.ws_handler import manager
 
 router = APIRouter()
 
+_SEL_ITEMS = select(ItemModel)
+
 
 # CRUD helpers
 def _validate_item_create(data: ItemCreate) -> None:
@@ -46,6 +49,20 @@ async def _get_item_or_404(db: AsyncSession, item_id: int) -> ItemModel:
     return item
 
 
+def _sync_rate(request: Request, item: ItemModel) -> None:
+    """Записать курс в кэш Poller после ручного создания или изменения элемента."""
+    poller: Optional[Poller] = getattr(request.app.state, "poller", None)
+    if poller is not None:
+        poller.update_cache(item.currency, item.rate)
+
+
+def _invalidate_rate(request: Request, currency: str) -> None:
+    """Сбросить курс в кэше Poller после удаления элемента."""
+    poller: Optional[Poller] = getattr(request.app.state, "poller", None)
+    if poller is not None:
+        poller.invalidate(currency)
+
+
 async def _broadcast(event_type: str, payload: dict) -> None:
     """Единая точка отправки WS-событий."""
     try:
@@ -61,7 +78,7 @@ async def _broadcast(event_type: str, payload: dict) -> None:
 @router.get("/items", response_model=List[Item])
 async def list_items(db: AsyncSession = Depends(get_db)):
     """Вернуть список всех элементов."""
-    result = await db.execute(select(ItemModel))
+    result = await db.execute(_SEL_ITEMS)
     return result.scalars().all()
 
 
@@ -72,29 +89,41 @@ async def retrieve_item(item_id: int, db: AsyncSession = Depends(get_db)):
 
 
 @router.post("/items", response_model=Item, status_code=status.HTTP_201_CREATED)
-async def create_item(item: ItemCreate, db: AsyncSession = Depends(get_db)):
+async def create_item(
+    item: ItemCreate,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+):
     # Валидация кода
     currency = item.currency.strip().upper()
     if not currency.isalpha():
         raise HTTPException(status_code=400, detail="Код может содержать только буквы")
 
-    # Проверка в базе перед добавлением
-    existing = await db.execute(select(ItemModel).where(ItemModel.currency == currency))
-    if existing.scalar_one_or_none():
-        raise HTTPException(status_code=409, detail="Элемент с таким currency уже существует")
-
-    model = ItemModel(
-        currency=currency,
-        rate=item.rate,
-        amount=item.amount,
-        platform=item.platform,
-        crypto_currency=item.crypto_currency
+    # Вставка без предварительной проверки: дубликат currency отсекает ON CONFLICT
+    stmt = (
+        dialect_insert(ItemModel)
+        .values(
+            currency=currency,
+            rate=item.rate,
+            amount=item.amount,
+            platform=item.platform,
+            crypto_currency=item.crypto_currency,
+        )
+        .on_conflict_do_nothing(index_elements=["currency"])
+        .returning(ItemModel)
     )
 
-    db.add(model)
-    await db.commit()
-    await db.refresh(model)
+    try:
+        model = (await db.execute(stmt)).scalar_one_or_none()
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail="Элемент с таким currency уже существует")
+
+    if model is None:
+        raise HTTPException(status_code=409, detail="Элемент с таким currency уже существует")
 
+    _sync_rate(request, model)
     return model
 
 
@@ -102,6 +131,7 @@ async def create_item(item: ItemCreate, db: AsyncSession = Depends(get_db)):
 async def update_item_partial(
     item_id: int,
     patch: ItemUpdate,
+    request: Request,
     db: AsyncSession = Depends(get_db),
 ):
     """Частичное обновление элемента."""
@@ -113,21 +143,24 @@ async def update_item_partial(
 
     for field, value in updated_fields.items():
         setattr(item, field, value)
+    # Задаём явно, чтобы не перечитывать строку после commit (expire_on_commit=False)
+    item.last_updated_time = datetime.utcnow()
 
     await db.commit()
-    await db.refresh(item)
+    _sync_rate(request, item)
 
-    await _broadcast("updated", {"item": jsonable_encoder(item)})
+    await _broadcast("updated", {"item": item_to_dict(item)})
     return item
 
 
 @router.delete("/items/{item_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_item(item_id: int, db: AsyncSession = Depends(get_db)):
+async def delete_item(item_id: int, request: Request, db: AsyncSession = Depends(get_db)):
     """Удаление элемента."""
     item = await _get_item_or_404(db, item_id)
 
     await db.delete(item)
     await db.commit()
+    _invalidate_rate(request, item.currency)
 
     await _broadcast("deleted", {"id": item_id})
 
@@ -1,4 +1,11 @@
+import os
+import uuid
+
 DATABASE_URL = "sqlite+aiosqlite:///./database.db"
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "20"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "40"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+DB_POOL_TIMEOUT = int(os.getenv("DB_POOL_TIMEOUT", "30"))
 CBR_URL = "https://www.cbr.ru/scripts/XML_daily.asp"
 BINANCE_URL = "https://api.binance.com/api/v3/ticker/price"
 POLL_INTERVAL_SECONDS = 30
@@ -8,4 +15,6 @@ CURRENCY = ("USD", "EUR", "JPY")
 CRYPTO_CODES = ("BTC", "ETH", "TON")
 CRYPTO_PLATFORM = "Binance"
 DEFAULT_TIMEOUT = 10
-NATS_SERVERS = ["nats://127.0.0.1:4222"]
\ No newline at end of file
+NATS_SERVERS = ["nats://127.0.0.1:4222"]
+# Идентификатор экземпляра приложения (метка origin в событиях NATS)
+INSTANCE_ID = uuid.uuid4().hex
\ No newline at end of file
@@ -1,11 +1,32 @@
+from typing import AsyncIterator
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
 from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 
-from app.config import DATABASE_URL
+from app.config import (
+    DATABASE_URL,
+    DB_POOL_SIZE,
+    DB_MAX_OVERFLOW,
+    DB_POOL_RECYCLE,
+    DB_POOL_TIMEOUT,
+)
+
+# Параметры драйвера PostgreSQL (asyncpg)
+_connect_args = {}
+if make_url(DATABASE_URL).drivername == "postgresql+asyncpg":
+    _connect_args = {"server_settings": {"application_name": "parser", "jit": "off"}}
+
 # Database engine
 engine = create_async_engine(
     DATABASE_URL,
-    echo=False,           # SQL-логи (только для отладки)
-    pool_pre_ping=True,   # Проверка соединения
+    echo=False,                       # SQL-логи (только для отладки)
+    pool_pre_ping=True,               # Проверка соединения
+    pool_size=DB_POOL_SIZE,           # Постоянные соединения в пуле
+    max_overflow=DB_MAX_OVERFLOW,     # Дополнительные соединения под нагрузкой
+    pool_recycle=DB_POOL_RECYCLE,     # Пересоздание соединений, сек
+    pool_timeout=DB_POOL_TIMEOUT,     # Ожидание свободного соединения, сек
+    connect_args=_connect_args,
 )
 
 
@@ -18,8 +39,19 @@ AsyncSessionLocal = async_sessionmaker(
 )
 
 
+# Upsert
+def dialect_insert(model):
+    """
+    INSERT текущего диалекта БД с поддержкой ON CONFLICT
+    (PostgreSQL и SQLite используют одинаковый API).
+    """
+    if engine.dialect.name == "postgresql":
+        return postgresql.insert(model)
+    return sqlite.insert(model)
+
+
 # Dependency
-async def get_db() -> AsyncSession:
+async def get_db() -> AsyncIterator[AsyncSession]:
     """
     FastAPI dependency.
     Создаёт и корректно закрывает сессию БД.
@@ -1,6 +1,7 @@
 from typing import Any, cast
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import ORJSONResponse
 from sqlmodel import SQLModel
 from app.api import router
 from app.config import NATS_SERVERS
@@ -8,8 +9,10 @@ from app.db.database import engine
 from app.nats.nats_pub import NatsPublisher
 from app.nats.nats_sub import NatsSubscriber
 from app.tasks.task_poller import Poller
+from app.ws.ws_handler import manager
 
-app = FastAPI(title="parser", version="1.0")
+# ORJSONResponse: быстрая сериализация ответов REST
+app = FastAPI(title="parser", version="1.0", default_response_class=ORJSONResponse)
 
 # Подключаем роуты
 app.include_router(router.router)
@@ -36,15 +39,16 @@ async def on_startup():
     await publisher.connect()
     app_state.nats_publisher = publisher
 
+    # Poller
+    poller = Poller(nats=publisher)
+    app_state.poller = poller
+
     # NATS Subscriber
-    subscriber = NatsSubscriber(servers=NATS_SERVERS)
+    subscriber = NatsSubscriber(servers=NATS_SERVERS, poller=poller)
     await subscriber.connect()
     app_state.nats_subscriber = subscriber
 
-    # Poller
-    poller = Poller(nats=publisher)
     poller.start()
-    app_state.poller = poller
 
 
 # Shutdown
@@ -58,4 +62,7 @@ async def on_shutdown():
     # Закрываем NATS Publisher
     publisher: NatsPublisher | None = getattr(app_state, "nats_publisher", None)
     if publisher is not None:
-        await publisher.close()
\ No newline at end of file
+        await publisher.close()
+
+    # Останавливаем фоновую рассылку WebSocket
+    await manager.close()
\ No newline at end of file
@@ -1,13 +1,13 @@
 from datetime import datetime
-from typing import Optional
+from typing import Any, Dict, Optional
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, String, DateTime
+from sqlalchemy import DDL, Column, String, DateTime, event
 
 
 class ItemModel(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     currency: str = Field(
-        sa_column=Column(String, nullable=False, unique=True)
+        sa_column=Column(String, nullable=False, unique=True, index=True)
     )
     rate: float
     amount: int
@@ -16,4 +16,28 @@ class ItemModel(SQLModel, table=True):
     last_updated_time: datetime = Field(
         default_factory=datetime.utcnow,
         sa_column=Column(DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
-    )
\ No newline at end of file
+    )
+
+
+# PostgreSQL: hash-индекс для поиска по равенству currency
+event.listen(
+    ItemModel.__table__,
+    "after_create",
+    DDL(
+        "CREATE INDEX IF NOT EXISTS ix_itemmodel_currency_hash "
+        "ON %(table)s USING hash (currency)"
+    ).execute_if(dialect="postgresql"),
+)
+
+
+def item_to_dict(item: ItemModel) -> Dict[str, Any]:
+    """Сериализация ItemModel для WS-событий без обхода модели через Pydantic."""
+    return {
+        "id": item.id,
+        "currency": item.currency,
+        "rate": item.rate,
+        "amount": item.amount,
+        "platform": item.platform,
+        "crypto_currency": item.crypto_currency,
+        "last_updated_time": item.last_updated_time.isoformat(),
+    }
\ No newline at end of file
@@ -68,12 +68,34 @@ class NatsPublisher:
         payload = json.dumps(message, ensure_ascii=False).encode("utf-8")
 
         try:
+            # Без flush: буфер клиента отправляется в фоне, остаток — при drain() в close()
             await self._client.publish(subject, payload)
-            # flush не обязателен, но полезен при low-latency событиях
-            await self._client.flush(timeout=1)
         except Exception as exc:
             print(
                 f"Ошибка публикации в NATS: subject={subject}, error={exc}",
                 flush=True,
             )
+            raise
+
+    async def publish_and_flush(
+        self,
+        subject: str,
+        message: Dict[str, Any],
+        timeout: float = 1,
+    ) -> None:
+        """
+        Публикация с ожиданием подтверждения доставки на сервер
+        (для единичных low-latency событий).
+        """
+        await self.publish(subject, message)
+
+        assert self._client is not None
+
+        try:
+            await self._client.flush(timeout=timeout)
+        except Exception as exc:
+            print(
+                f"Ошибка flush NATS: subject={subject}, error={exc}",
+                flush=True,
+            )
             raise
\ No newline at end of file
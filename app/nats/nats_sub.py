@@ -1,13 +1,15 @@
 import asyncio
 import json
+from datetime import datetime
 from typing import Any, Dict, Optional
 
 from nats.aio.client import Client as NATS
-from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.config import INSTANCE_ID
 from app.db.database import AsyncSessionLocal
-from app.models.item_model import ItemModel
+from app.services.parser import upsert_items
+from app.tasks.task_poller import Poller
 from app.ws.ws_handler import manager
 
 
@@ -15,13 +17,14 @@ class NatsSubscriber:
     """
     NATS subscriber для обработки событий items.updates.
 
-    - Получает события из NATS
-    - Синхронизирует данные с БД
+    - Получает события из NATS (кроме опубликованных этим же экземпляром)
+    - Синхронизирует данные с БД и кэшем курсов Poller
     - Рассылает события по WebSocket
     """
 
-    def __init__(self, servers: list[str]) -> None:
+    def __init__(self, servers: list[str], poller: Optional[Poller] = None) -> None:
         self._servers = servers
+        self._poller = poller
         self._client: Optional[NATS] = None
         self._lock = asyncio.Lock()
 
@@ -67,12 +70,16 @@ class NatsSubscriber:
             print(f"Ошибка парсинга NATS сообщения: {exc}", flush=True)
             return
 
+        # Свои события уже записаны в БД и разосланы по WS Poller'ом
+        if data.pop("origin", None) == INSTANCE_ID:
+            return
+
         item_data = data.get("item")
         if not isinstance(item_data, dict):
             return
 
         currency = item_data.get("currency")
-        if not currency:
+        if not currency or "rate" not in item_data:
             return
 
         async with AsyncSessionLocal() as db:
@@ -87,30 +94,20 @@ class NatsSubscriber:
 
     # DB logic
     async def _upsert_item(self, db: AsyncSession, item: Dict[str, Any]) -> None:
-        """Создание или обновление Item по currency."""
-        result = await db.execute(
-            select(ItemModel).where(ItemModel.currency == item["currency"])
-        )
-        model = result.scalar_one_or_none()
-
-        if model is None:
-            model = ItemModel(
-                currency=item["currency"],
-                rate=item.get("rate", 0),
-                amount=item.get("amount", 1),
-                platform=item.get("platform", ""),
-                crypto_currency=item.get("crypto_currency", False),
-            )
-            db.add(model)
-            action = "created"
-        else:
-            model.rate = item.get("rate", model.rate)
-            model.amount = item.get("amount", model.amount)
-            model.platform = item.get("platform", model.platform)
-            model.crypto_currency = item.get("crypto_currency", model.crypto_currency)
-            action = "updated"
-
-        await db.commit()
-        await db.refresh(model)
-
-        print(f"Item {action} from NATS: currency={model.currency}", flush=True)
\ No newline at end of file
+        """
+        Создание или обновление Item по currency одним INSERT ... ON CONFLICT:
+        событие несёт полное состояние, предварительный SELECT не нужен.
+        """
+        await upsert_items(db, [{
+            "currency": item["currency"],
+            "rate": item["rate"],
+            "amount": item.get("amount", 1),
+            "platform": item.get("platform", ""),
+            "crypto_currency": item.get("crypto_currency", False),
+            "last_updated_time": datetime.utcnow(),
+        }])
+
+        if self._poller is not None:
+            self._poller.update_cache(item["currency"], item["rate"])
+
+        print(f"Item upserted from NATS: currency={item['currency']}", flush=True)
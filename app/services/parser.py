@@ -1,238 +1,166 @@
-import asyncio
-import requests
-import xml.etree.ElementTree as ET
-from datetime import datetime, date
-from typing import Dict, Tuple
-
-from sqlalchemy import select
-
-from app.config import (
-    CBR_URL,
-    USER_AGENT,
-    CURRENCY,
-    CBR_PLATFORM,
-    POLL_INTERVAL_SECONDS,
-    CRYPTO_CODES,
-    CRYPTO_PLATFORM,
-    BINANCE_URL,
-    DEFAULT_TIMEOUT,
-)
-from app.models.item_model import ItemModel
-from app.ws.ws_handler import manager
+import json
+from datetime import datetime
+from io import BytesIO
+from typing import Dict, Iterable, List, Optional, Tuple
 
+from lxml import etree
+from sqlalchemy import bindparam, select
 
-# In-memory cache: date -> rates
-_rates_cache: Dict[str, Dict[str, Dict]] = {}
+from app.config import CBR_PLATFORM, CRYPTO_CODES
+from app.db.database import dialect_insert
+from app.models.item_model import ItemModel
 
 
-# Utils
+_CRYPTO = frozenset(CRYPTO_CODES)
 
-def format_cbr_date(dt: date) -> str:
-    """Формат даты для Центробанк"""
-    return dt.strftime("%d/%m/%Y")
+# Ответ ЦБ: (rates, etag, last_modified)
+CbrEntry = Tuple[Dict[str, Dict], Optional[str], Optional[str]]
 
 
 # CBR
 
-def parse_cbr_xml(xml: bytes, allowed_codes: Tuple[str, ...]) -> Dict[str, Dict]:
+def parse_cbr_xml(xml: bytes, allowed_codes: Iterable[str]) -> Dict[str, Dict]:
     """
     Парсит XML ЦБ и возвращает словарь курсов:
     { "USD": {rate, amount, platform}, ... }
     """
     result: Dict[str, Dict] = {}
+    allowed = frozenset(allowed_codes)
 
     try:
-        root = ET.fromstring(xml)
-    except Exception:
+        # Потоковый разбор: обрабатываем только закрытые <Valute>
+        for _, valute in etree.iterparse(BytesIO(xml), events=("end",), tag="Valute"):
+            currency = (valute.findtext("CharCode") or "").strip()
+            unit_rate = valute.findtext("VunitRate")
+            value = valute.findtext("Value")
+            nominal = valute.findtext("Nominal")
+            valute.clear()
+
+            if currency not in allowed:
+                continue
+
+            try:
+                if unit_rate:
+                    value, amount = float(unit_rate.replace(",", ".")), 1
+                else:
+                    value = float(value.replace(",", "."))
+                    amount = int(nominal) if nominal else 1
+            except Exception:
+                continue
+
+            result[currency] = {
+                "rate": value / amount,
+                "amount": amount,
+                "platform": CBR_PLATFORM,
+            }
+    except etree.XMLSyntaxError:
         return result
 
-    for valute in root.findall(".//Valute"):
-        code_node = valute.find("CharCode")
-        if code_node is None or not code_node.text:
-            continue
-
-        currency = code_node.text.strip()
-        if currency not in allowed_codes:
-            continue
-
-        value_node = valute.find("Value") or valute.find("VunitRate")
-        amount_node = valute.find("amount")
-
-        try:
-            value = float(value_node.text.replace(",", "."))
-            amount = int(amount_node.text) if amount_node is not None else 1
-        except Exception:
-            continue
-
-        result[currency] = {
-            "rate": value / amount,
-            "amount": amount,
-            "platform": CBR_PLATFORM,
-        }
-
     return result
 
 
-def fetch_cbr_rates_sync(dt: date) -> Dict[str, Dict]:
-    """
-    Синхронно запрашивает курсы ЦБ (используется через asyncio.to_thread)
-    """
-    date_key = format_cbr_date(dt)
-    if date_key in _rates_cache:
-        return _rates_cache[date_key]
+def cbr_conditional_headers(cached: Optional[CbrEntry]) -> Dict[str, str]:
+    """Заголовки условного GET по валидаторам прошлого ответа ЦБ"""
+    headers: Dict[str, str] = {}
+    if cached is None:
+        return headers
 
-    url = CBR_URL.format(date=date_key)
-    headers = {"User-Agent": USER_AGENT}
+    _, etag, last_modified = cached
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
 
-    try:
-        resp = requests.get(url, headers=headers, timeout=DEFAULT_TIMEOUT)
-        resp.raise_for_status()
-    except Exception as exc:
-        print(f"Ошибка запроса ЦБ: {exc}", flush=True)
-        fallback = {
-            "RUB": {"rate": 80.0, "amount": 1, "platform": CBR_PLATFORM}
-        }
-        _rates_cache[date_key] = fallback
-        return fallback
-
-    rates = {
-        "RUB": {"rate": 1.0, "amount": 1, "platform": CBR_PLATFORM}
-    }
-    rates.update(parse_cbr_xml(resp.content, CURRENCY))
 
-    _rates_cache[date_key] = rates
-    return rates
+def cbr_entry(rates: Dict[str, Dict], resp_headers) -> CbrEntry:
+    return rates, resp_headers.get("ETag"), resp_headers.get("Last-Modified")
 
 
 # Crypto
-def fetch_crypto_rates_sync(
-    symbols: Tuple[str, ...],
-    usd_rub_rate: float,
-) -> Dict[str, Dict]:
-    """
-    Получает курсы крипты с Binance
-    """
-    result: Dict[str, Dict] = {}
-    headers = {"User-Agent": USER_AGENT}
-
-    for symbol in symbols:
-        pair = f"{symbol}USDT"
-
-        try:
-            resp = requests.get(
-                BINANCE_URL,
-                headers=headers,
-                params={"symbol": pair},
-                timeout=DEFAULT_TIMEOUT,
-            )
-            resp.raise_for_status()
-            data = resp.json()
-            price_usdt = float(data["price"])
-        except Exception as exc:
-            print(f"Ошибка Binance {pair}: {exc}", flush=True)
-            continue
-
-        result[symbol] = {
-            "rate": price_usdt * usd_rub_rate,
-            "amount": 1,
-            "platform": CRYPTO_PLATFORM or "binance",
-        }
-
-    return result
+def binance_symbols_param(pairs: Iterable[str]) -> str:
+    """Значение параметра symbols для batch-запроса Binance: ["BTCUSDT","ETHUSDT"]"""
+    return json.dumps(list(pairs), separators=(",", ":"))
 
 
 # DB
-async def upsert_item(db, currency: str, data: Dict):
+def item_row(currency: str, data: Dict) -> Dict:
+    """Строка таблицы ItemModel из распарсенного курса"""
+    return {
+        "currency": currency,
+        "rate": data["rate"],
+        "amount": data.get("amount", 1),
+        "platform": data.get("platform", ""),
+        "crypto_currency": currency in _CRYPTO,
+        "last_updated_time": datetime.utcnow(),
+    }
+
+
+def collect_changes(
+    previous: Dict[str, float],
+    rates: Dict[str, Dict],
+) -> List[Tuple[str, Dict]]:
     """
-    Создаёт или обновляет ItemModel
+    Сравнивает свежие курсы с сохранёнными и возвращает
+    [(event_type, row), ...] только для новых и изменившихся валют
     """
-    result = await db.execute(
-        select(ItemModel).where(ItemModel.currency == currency)
-    )
-    item = result.scalar_one_or_none()
+    changes: List[Tuple[str, Dict]] = []
 
-    crypto_currency = currency in CRYPTO_CODES
+    for currency, data in rates.items():
+        old_rate = previous.get(currency)
+        if old_rate is None:
+            changes.append(("created", item_row(currency, data)))
+        elif abs(old_rate - data["rate"]) >= 1e-9:
+            changes.append(("updated", item_row(currency, data)))
 
-    if item is None:
-        item = ItemModel(
-            currency=currency,
-            rate=data["rate"],
-            amount=data.get("amount", 1),
-            platform=data.get("platform", ""),
-            crypto_currency=crypto_currency,
-        )
-        db.add(item)
-        await db.commit()
-        await db.refresh(item)
+    return changes
 
-        await broadcast_event("created", item)
-        return
 
-    if abs(item.rate - data["rate"]) < 1e-9:
-        return
+# Запросы собираются один раз при импорте и переиспользуются
+_SEL_RATES = select(ItemModel.currency, ItemModel.rate)
+_SEL_RATES_BY_CURRENCY = _SEL_RATES.where(
+    ItemModel.currency.in_(bindparam("currencies", expanding=True))
+)
 
-    item.rate = data["rate"]
-    item.amount = data.get("amount", item.amount)
-    item.platform = data.get("platform", item.platform)
-    item.crypto_currency = crypto_currency
-    item.last_updated_time = datetime.utcnow()
 
-    await db.commit()
-    await db.refresh(item)
+def _build_upsert():
+    stmt = dialect_insert(ItemModel.__table__)
+    return stmt.on_conflict_do_update(
+        index_elements=["currency"],
+        set_={
+            "rate": stmt.excluded.rate,
+            "amount": stmt.excluded.amount,
+            "platform": stmt.excluded.platform,
+            "crypto_currency": stmt.excluded.crypto_currency,
+            "last_updated_time": stmt.excluded.last_updated_time,
+        },
+    )
 
-    await broadcast_event("updated", item)
 
+_UPSERT_ITEMS = _build_upsert()
 
-# WS
-async def broadcast_event(event_type: str, item: ItemModel):
-    try:
-        await manager.broadcast({
-            "type": event_type,
-            "item": {
-                "currency": item.currency,
-                "rate": item.rate,
-                "amount": item.amount,
-                "platform": item.platform,
-                "crypto_currency": item.crypto_currency,
-            }
-        })
-    except Exception:
-        print(f"WS broadcast failed ({event_type})", flush=True)
 
+async def select_rates(
+    db,
+    currencies: Optional[Iterable[str]] = None,
+) -> Dict[str, float]:
+    """Текущие курсы из БД одним запросом: {currency: rate} (все, если currencies не задан)"""
+    if currencies is None:
+        result = await db.execute(_SEL_RATES)
+    else:
+        result = await db.execute(
+            _SEL_RATES_BY_CURRENCY, {"currencies": list(currencies)}
+        )
+    return {currency: rate for currency, rate in result.all()}
 
-# Poll loop
 
-async def poll_loop(app):
+async def upsert_items(db, rows: List[Dict]) -> None:
     """
-    Основной polling-цикл
+    Создаёт или обновляет все строки одним INSERT ... ON CONFLICT DO UPDATE
+    (executemany по заранее собранному запросу)
     """
-    while True:
-        try:
-            today = datetime.utcnow().date()
-
-            cbr_rates = await asyncio.to_thread(
-                fetch_cbr_rates_sync,
-                today,
-            )
-
-            usd_rate = cbr_rates.get("USD", {}).get("rate", 80.0)
-
-            crypto_rates = await asyncio.to_thread(
-                fetch_crypto_rates_sync,
-                CRYPTO_CODES,
-                usd_rate,
-            )
-
-            all_rates = {**cbr_rates, **crypto_rates}
-
-            async with app.state.db() as db:
-                for currency, data in all_rates.items():
-                    await upsert_item(db, currency, data)
-
-            await asyncio.sleep(POLL_INTERVAL_SECONDS)
+    if not rows:
+        return
 
-        except asyncio.CancelledError:
-            break
-        except Exception as exc:
-            print(f"Ошибка poll_loop: {exc}", flush=True)
-            await asyncio.sleep(POLL_INTERVAL_SECONDS)
\ No newline at end of file
+    await db.execute(_UPSERT_ITEMS, rows)
+    await db.commit()
\ No newline at end of file
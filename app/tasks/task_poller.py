@@ -1,9 +1,7 @@
 import asyncio
-from datetime import datetime
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import httpx
-from sqlalchemy import select
 
 from app.config import (
     CBR_URL,
@@ -15,70 +13,137 @@ from app.config import (
     CRYPTO_CODES,
     CRYPTO_PLATFORM,
     DEFAULT_TIMEOUT,
+    INSTANCE_ID,
 )
 from app.db.database import AsyncSessionLocal
-from app.models.item_model import ItemModel
 from app.nats.nats_pub import NatsPublisher
-from app.services.parser import parse_cbr_xml
+from app.services.parser import (
+    CbrEntry,
+    binance_symbols_param,
+    cbr_conditional_headers,
+    cbr_entry,
+    collect_changes,
+    parse_cbr_xml,
+    select_rates,
+    upsert_items,
+)
 from app.ws.ws_handler import manager
 
 
 # HTTP
 
-async def fetch_cbr(client: httpx.AsyncClient, wanted: Tuple[str, ...]) -> Dict[str, Dict]:
+async def fetch_cbr(
+    client: httpx.AsyncClient,
+    wanted: Tuple[str, ...],
+    cached: Optional[CbrEntry] = None,
+) -> CbrEntry:
+    """
+    Курсы ЦБ условным GET: при 304 возвращается cached без разбора XML
+    """
     try:
-        resp = await client.get(CBR_URL)
+        resp = await client.get(CBR_URL, headers=cbr_conditional_headers(cached))
+        if resp.status_code == 304 and cached is not None:
+            return cached
         resp.raise_for_status()
     except Exception as exc:
         print(f"Ошибка ЦБ: {exc}", flush=True)
+        if cached is not None:
+            return cached
         return {
             "RUB": {"rate": 1.0, "amount": 1, "platform": CBR_PLATFORM}
-        }
+        }, None, None
 
     rates = {
         "RUB": {"rate": 1.0, "amount": 1, "platform": CBR_PLATFORM}
     }
     rates.update(parse_cbr_xml(resp.content, wanted))
-    return rates
+    return cbr_entry(rates, resp.headers)
 
 
-async def fetch_binance(
+async def _fetch_binance_batch(
     client: httpx.AsyncClient,
-    symbols: Tuple[str, ...],
-    usd_rub: float,
-) -> Dict[str, Dict]:
-    result: Dict[str, Dict] = {}
+    pairs: Dict[str, str],
+) -> Dict[str, float]:
+    """Цены всех пар одним запросом: {"BTC": price_usdt, ...}"""
+    resp = await client.get(
+        BINANCE_URL,
+        params={"symbols": binance_symbols_param(pairs)},
+    )
+    resp.raise_for_status()
+
+    prices: Dict[str, float] = {}
+    for row in resp.json():
+        sym = pairs.get(row.get("symbol"))
+        if sym is None:
+            continue
+
+        try:
+            prices[sym] = float(row["price"])
+        except Exception as exc:
+            print(f"Binance {row.get('symbol')}: {exc}", flush=True)
+
+    return prices
 
-    for sym in symbols:
-        pair = f"{sym}USDT"
+
+async def _fetch_binance_each(
+    client: httpx.AsyncClient,
+    pairs: Dict[str, str],
+) -> Dict[str, float]:
+    """Запасной вариант: параллельные запросы по каждой паре."""
+    responses = await asyncio.gather(
+        *[client.get(BINANCE_URL, params={"symbol": pair}) for pair in pairs],
+        return_exceptions=True,
+    )
+
+    prices: Dict[str, float] = {}
+    for (pair, sym), resp in zip(pairs.items(), responses):
         try:
-            resp = await client.get(BINANCE_URL, params={"symbol": pair})
+            if isinstance(resp, BaseException):
+                raise resp
             resp.raise_for_status()
-            price = float(resp.json()["price"])
+            prices[sym] = float(resp.json()["price"])
         except Exception as exc:
             print(f"Binance {pair}: {exc}", flush=True)
-            continue
 
-        result[sym] = {
+    return prices
+
+
+async def _fetch_binance_prices(
+    client: httpx.AsyncClient,
+    symbols: Tuple[str, ...],
+) -> Dict[str, float]:
+    """Цены в USDT: {"BTC": price_usdt, ...}"""
+    pairs = {f"{sym}USDT": sym for sym in symbols}
+
+    try:
+        return await _fetch_binance_batch(client, pairs)
+    except Exception as exc:
+        print(f"Binance {list(pairs)}: {exc}, запрашиваем по отдельности", flush=True)
+        return await _fetch_binance_each(client, pairs)
+
+
+def _crypto_rates(prices: Dict[str, float], usd_rub: float) -> Dict[str, Dict]:
+    return {
+        sym: {
             "rate": price * usd_rub,
             "amount": 1,
             "platform": CRYPTO_PLATFORM or "Binance",
         }
-
-    return result
+        for sym, price in prices.items()
+    }
 
 
 # EVENTS
 
-async def emit_event(event_type: str, item: ItemModel, nats: NatsPublisher):
+async def emit_event(event_type: str, item: Dict, nats: NatsPublisher):
     payload = {
         "type": event_type,
         "item": {
-            "currency": item.currency,
-            "rate": item.rate,
-            "amount": item.amount,
-            "platform": item.platform,
-            "crypto_currency": item.crypto_currency,
+            "currency": item["currency"],
+            "rate": item["rate"],
+            "amount": item["amount"],
+            "platform": item["platform"],
+            "crypto_currency": item["crypto_currency"],
         },
     }
 
@@ -88,49 +153,11 @@ async def emit_event(event_type: str, item: ItemModel, nats: NatsPublisher):
         print("WS broadcast failed", flush=True)
 
     try:
-        await nats.publish("items.updates", payload)
+        await nats.publish("items.updates", {**payload, "origin": INSTANCE_ID})
     except Exception:
         print("NATS publish failed", flush=True)
 
 
-# DB
-
-async def upsert_item(db, currency: str, data: Dict, nats: NatsPublisher):
-    result = await db.execute(
-        select(ItemModel).where(ItemModel.currency == currency)
-    )
-    item = result.scalar_one_or_none()
-
-    crypto_currency = currency in CRYPTO_CODES
-
-    if item is None:
-        item = ItemModel(
-            currency=currency,
-            rate=data["rate"],
-            amount=data.get("amount", 1),
-            platform=data.get("platform", ""),
-            crypto_currency=crypto_currency,
-        )
-        db.add(item)
-        await db.commit()
-        await db.refresh(item)
-        await emit_event("created", item, nats)
-        return
-
-    if abs(item.rate - data["rate"]) < 1e-9:
-        return
-
-    item.rate = data["rate"]
-    item.amount = data.get("amount", item.amount)
-    item.platform = data.get("platform", item.platform)
-    item.crypto_currency = crypto_currency
-    item.last_updated_time = datetime.utcnow()
-
-    await db.commit()
-    await db.refresh(item)
-    await emit_event("updated", item, nats)
-
-
 # POLLER
 
 class Poller:
@@ -140,18 +167,61 @@ class Poller:
         self._client = httpx.AsyncClient(
             headers={"User-Agent": USER_AGENT},
             timeout=DEFAULT_TIMEOUT,
+            http2=True,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16),
         )
+        # Последний ответ ЦБ для условных запросов
+        self._cbr: Optional[CbrEntry] = None
+        # Последние сохранённые курсы: currency -> rate
+        self._cache: Dict[str, float] = {}
+        self._cache_ready = False
+        # Курс USD прошлого опроса: запасной, если в ответе ЦБ нет USD
+        self._last_usd: float = 80.0
+
+    # Cache
+    async def warm_cache(self):
+        """Загрузка всех курсов из БД одним запросом."""
+        async with AsyncSessionLocal() as db:
+            self._cache = await select_rates(db)
+        self._last_usd = self._cache.get("USD", self._last_usd)
+        self._cache_ready = True
+
+    def update_cache(self, currency: str, rate: float):
+        self._cache[currency] = rate
+
+    def invalidate(self, currency: str):
+        """Сброс курса после удаления строки в обход Poller (REST)."""
+        self._cache.pop(currency, None)
 
     async def run_once(self):
-        rates = await fetch_cbr(self._client, CURRENCY)
-        usd = rates.get("USD", {}).get("rate", 80.0)
+        if not self._cache_ready:
+            await self.warm_cache()
+
+        # ЦБ и Binance опрашиваются одновременно: Binance отдаёт цены в USDT,
+        # в рубли они переводятся уже по свежему курсу USD
+        self._cbr, prices = await asyncio.gather(
+            fetch_cbr(self._client, CURRENCY, self._cbr),
+            _fetch_binance_prices(self._client, CRYPTO_CODES),
+        )
+        rates = self._cbr[0]
+        usd = rates.get("USD", {}).get("rate", self._last_usd)
+        self._last_usd = usd
+
+        combined = {**rates, **_crypto_rates(prices, usd)}
 
-        crypto = await fetch_binance(self._client, CRYPTO_CODES, usd)
-        combined = {**rates, **crypto}
+        # В БД идём только если какой-то курс изменился
+        changes = collect_changes(self._cache, combined)
+        if not changes:
+            return
 
         async with AsyncSessionLocal() as db:
-            for currency, data in combined.items():
-                await upsert_item(db, currency, data, self.nats)
+            await upsert_items(db, [row for _, row in changes])
+
+        for _, row in changes:
+            self.update_cache(row["currency"], row["rate"])
+
+        for event_type, row in changes:
+            await emit_event(event_type, row, self.nats)
 
     async def _loop(self):
         while True:
@@ -1,17 +1,33 @@
-from typing import Set
+from typing import Dict, List, Optional, Set
 from fastapi import WebSocket
-from fastapi.encoders import jsonable_encoder
 import asyncio
+import orjson
+
+
+# Таймаут отправки одному клиенту, сек
+SEND_TIMEOUT = 5.0
+# Размер исходящей очереди клиента (сообщений)
+OUTBOX_SIZE = 32
+# Окно склейки событий в один кадр, сек
+COALESCE_WINDOW = 0.01
 
 
 class ConnectionManager:
     def __init__(self):
         self.active: Set[WebSocket] = set()
         self._has_clients = asyncio.Event()
+        self._queues: Dict[WebSocket, asyncio.Queue] = {}
+        self._relays: Dict[WebSocket, asyncio.Task] = {}
+        self._closing: Set[asyncio.Task] = set()
+        self._pending: List[dict] = []
+        self._has_pending = asyncio.Event()
+        self._flusher: Optional[asyncio.Task] = None
 
     async def connect(self, ws: WebSocket):
         await ws.accept()
         self.active.add(ws)
+        self._queues[ws] = asyncio.Queue(maxsize=OUTBOX_SIZE)
+        self._relays[ws] = asyncio.create_task(self._relay(ws))
         self._has_clients.set()
 
         client_info = getattr(ws, "client", None)
@@ -21,7 +37,16 @@ class ConnectionManager:
         )
 
     def disconnect(self, ws: WebSocket):
+        if ws not in self.active:
+            return
+
         self.active.discard(ws)
+        self._queues.pop(ws, None)
+
+        relay = self._relays.pop(ws, None)
+        if relay is not None and relay is not asyncio.current_task():
+            relay.cancel()
+
         print(
             f"WebSocket отключен: client={getattr(ws, 'client', None)}, total={len(self.active)}, manager_id={id(self)}",
             flush=True
@@ -29,22 +54,91 @@ class ConnectionManager:
         if not self.active:
             self._has_clients.clear()
 
+    async def _relay(self, ws: WebSocket):
+        """
+        Фоновая задача клиента: переносит сообщения из его очереди в сокет
+        """
+        queue = self._queues[ws]
+        try:
+            while True:
+                message = await queue.get()
+                await asyncio.wait_for(ws.send_text(message), timeout=SEND_TIMEOUT)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            self.disconnect(ws)
+            print(f"Удалён неработающий WebSocket: client={getattr(ws, 'client', None)}", flush=True)
+
+    def _drop_slow(self, ws: WebSocket):
+        """Отключение клиента, который не успевает разбирать очередь."""
+        self.disconnect(ws)
+        print(f"Отключен медленный WebSocket: client={getattr(ws, 'client', None)}", flush=True)
+
+        task = asyncio.create_task(self._close(ws, code=1013))
+        self._closing.add(task)
+        task.add_done_callback(self._closing.discard)
+
+    @staticmethod
+    async def _close(ws: WebSocket, code: int):
+        try:
+            await asyncio.wait_for(ws.close(code=code), timeout=SEND_TIMEOUT)
+        except Exception:
+            pass
+
     async def broadcast(self, message: dict):
         if not self.active:
             return
 
-        data = jsonable_encoder(message)
-        bad_connections = []
+        # Копим события в буфере, отправкой занимается _flush_loop
+        self._pending.append(message)
+        self._has_pending.set()
+
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        """
+        Отправляет накопленные за COALESCE_WINDOW события одним кадром —
+        всегда JSON-массивом, даже если событие одно.
+        """
+        while True:
+            await self._has_pending.wait()
+            await asyncio.sleep(COALESCE_WINDOW)
+
+            batch, self._pending = self._pending, []
+            self._has_pending.clear()
+
+            try:
+                payload = orjson.dumps(batch, default=str).decode("utf-8")
+            except Exception as exc:
+                print(f"Ошибка сериализации WS-сообщения: {exc}", flush=True)
+                continue
+
+            self._fan_out(payload)
+
+    def _fan_out(self, payload: str):
+        """Кладёт готовый кадр в очереди всех клиентов без ожидания отправки."""
+        slow_connections = []
 
         for ws in list(self.active):
             try:
-                await ws.send_json(data)
-            except Exception:
-                bad_connections.append(ws)
+                self._queues[ws].put_nowait(payload)
+            except asyncio.QueueFull:
+                slow_connections.append(ws)
 
-        for ws in bad_connections:
-            self.disconnect(ws)
-            print(f"Удалён неработающий WebSocket: client={getattr(ws, 'client', None)}", flush=True)
+        for ws in slow_connections:
+            self._drop_slow(ws)
+
+    async def close(self):
+        """Остановка фоновой отправки (при shutdown приложения)."""
+        tasks = [*self._relays.values(), *self._closing]
+        if self._flusher is not None:
+            tasks.append(self._flusher)
+            self._flusher = None
+
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
     async def wait_for_clients(self, timeout: float | None = None) -> bool:
         """
@@ -58,4 +152,4 @@ class ConnectionManager:
 
 
 # Singleton
-manager = ConnectionManager()
\ No newline at end of file
+manager = ConnectionManager()